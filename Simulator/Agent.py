@@ -9,7 +9,32 @@ import numpy as np
 import random
 from mesa import Agent
 
+def population_field(name):
+    """
+    Per-agent draw that is read from the model's population when it has one,
+    so the draws are not copied into every agent. It is read-only then.
+    """
+    def get(self):
+        population = self.model.population
+        if population is None:
+            return self.__dict__[name]
+        return population.value(name, self.unique_id)
+
+    def set(self, value):
+        if self.model.population is not None:
+            raise AttributeError(f"{name} is read from the model's population and cannot be assigned")
+        self.__dict__[name] = value
+
+    return property(get, set)
+
 class SIERDAgent(Agent):
+    residence_area = population_field("residence_area")
+    workplace = population_field("workplace")
+    transmission_rate = population_field("transmission_rate")
+    latency_period = population_field("latency_period")
+    infection_duration = population_field("infection_duration")
+    recovery_rate = population_field("recovery_rate")
+
     def __init__(self, unique_id, model, wearing_mask=False, isolated=False, recovered=False):
         """
         Initialize a SIERDAgent.
@@ -29,6 +54,9 @@ class SIERDAgent(Agent):
         self.recovered = recovered  # Indicates if the agent has recovered from infection
         self.infection_history = []  # History of infections
 
+        if model.population is not None:
+            return  # The draws are read from the prebuilt (possibly shared) population
+
         # Initialize residence and workplace
         self.residence_area = (random.randint(0, model.grid.width - 1), random.randint(0, model.grid.height - 1))
         self.workplace = (random.randint(0, model.grid.width - 1), random.randint(0, model.grid.height - 1))
@@ -171,6 +199,8 @@ class SIERDAgent(Agent):
         """
         Check if the susceptible agent gets exposed to the virus from infected neighbors.
         """
+        if self.model.contact_engine:
+            return  # Transmission is handled by the contact-matrix engine
         if self.isolated:
             return  # If isolated, the agent does not get exposed
         cellmates = self.model.grid.get_cell_list_contents([self.pos])
@@ -182,6 +212,8 @@ class SIERDAgent(Agent):
                 if random.random() < transmission_rate:
                     self.state = "Exposed"  # Change state to exposed
                     self.infection_time = self.model.schedule.time  # Record the time of exposure
+                    if self.model.tracer is not None:
+                        self.model.tracer.record(agent, self)
                     break
 
     def progress_to_infected(self):
@@ -195,6 +227,8 @@ class SIERDAgent(Agent):
         """
         Infect susceptible neighbors if the agent is in the infected state.
         """
+        if self.model.contact_engine:
+            return  # Transmission is handled by the contact-matrix engine
         if self.isolated:
             return  # If isolated, the agent does not infect others
         cellmates = self.model.grid.get_cell_list_contents([self.pos])
@@ -208,6 +242,8 @@ class SIERDAgent(Agent):
                 if random.random() < transmission_rate:
                     agent.state = "Exposed"  # Change neighbor's state to exposed
                     agent.infection_time = self.model.schedule.time  # Record the time of exposure
+                    if self.model.tracer is not None:
+                        self.model.tracer.record(self, agent)
 
     def progress_to_recovered_or_dead(self):
         """
@@ -226,6 +262,8 @@ class SIERDAgent(Agent):
         """
         Check if the recovered agent gets re-exposed to the virus.
         """
+        if self.model.contact_engine:
+            return  # Transmission is handled by the contact-matrix engine
         if self.isolated:
             return  # If isolated, the agent does not get re-exposed
         cellmates = self.model.grid.get_cell_list_contents([self.pos])
@@ -237,4 +275,6 @@ class SIERDAgent(Agent):
                 if random.random() < transmission_rate:
                     self.state = "Exposed"  # Change state to exposed again
                     self.infection_time = self.model.schedule.time  # Record the time of re-exposure
+                    if self.model.tracer is not None:
+                        self.model.tracer.record(agent, self)
                     break
\ No newline at end of file
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming statistics for replicate ensembles.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import stats as scipy_stats
+
+COMPARTMENTS = ["Susceptible", "Exposed", "Infected", "Recovered", "Dead"]
+
+class RunningStats:
+    def __init__(self, shape):
+        """
+        Initialize a RunningStats accumulator.
+
+        Uses Welford's algorithm elementwise, so one accumulator can track
+        every step and compartment of a run at once.
+
+        Args:
+            shape: Shape of the values folded in per replicate.
+        """
+        self.count = 0
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)  # Sum of squared deviations from the mean
+
+    def add(self, values):
+        """
+        Fold one replicate into the running statistics.
+
+        Args:
+            values: Array of values with the accumulator's shape.
+        """
+        values = np.asarray(values, dtype=float)
+        self.count += 1
+        delta = values - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (values - self.mean)
+
+    def merge(self, other):
+        """
+        Combine the statistics of another accumulator into this one.
+
+        Args:
+            other: A RunningStats with the same shape.
+        """
+        if other.mean.shape != self.mean.shape:
+            raise ValueError("Cannot merge running statistics with different shapes.")
+        count = self.count + other.count
+        if count == 0:
+            return
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+
+    def variance(self):
+        """
+        Return the sample variance (NaN until two replicates are in).
+        """
+        if self.count < 2:
+            return np.full_like(self.m2, np.nan)
+        return self.m2 / (self.count - 1)
+
+class EnsembleAggregator:
+    def __init__(self, steps, columns=COMPARTMENTS, value_range=(0, 1), bins=100):
+        """
+        Initialize an EnsembleAggregator.
+
+        Folds finished runs into per-step running mean, variance and a
+        fixed-bin histogram sketch for approximate quantiles, so memory
+        does not grow with the number of replicates.
+
+        Args:
+            steps: Number of steps in every run.
+            columns: Result columns to aggregate (default: the SIERD compartments).
+            value_range: Lower and upper bound of the histogram sketch, e.g. (0, num_agents).
+            bins: Number of histogram bins per step and column (default: 100).
+        """
+        self.steps = steps
+        self.columns = list(columns)
+        self.value_range = (float(value_range[0]), float(value_range[1]))
+        self.bins = bins
+        self.stats = RunningStats((steps, len(self.columns)))
+        self.histogram = np.zeros((steps, len(self.columns), bins), dtype=np.int64)
+        self.minimum = np.full((steps, len(self.columns)), np.inf)
+        self.maximum = np.full((steps, len(self.columns)), -np.inf)
+
+    @property
+    def count(self):
+        return self.stats.count
+
+    def add(self, results):
+        """
+        Fold a finished run into the aggregate.
+
+        Args:
+            results: The results dataframe of one run, with one row per step.
+        """
+        if len(results) != self.steps:
+            raise ValueError(f"Expected {self.steps} steps, got {len(results)}.")
+        values = results[self.columns].to_numpy(dtype=float)
+        self.stats.add(values)
+        np.minimum(self.minimum, values, out=self.minimum)
+        np.maximum(self.maximum, values, out=self.maximum)
+
+        low, high = self.value_range
+        index = np.floor((values - low) / (high - low) * self.bins).astype(np.int64)
+        index = np.clip(index, 0, self.bins - 1)  # Out-of-range values go to the edge bins
+        steps, columns = np.indices(values.shape)
+        np.add.at(self.histogram, (steps, columns, index), 1)
+
+    def merge(self, other):
+        """
+        Combine a partial aggregate, e.g. from another worker, into this one.
+
+        Args:
+            other: An EnsembleAggregator with the same steps, columns and sketch settings.
+        """
+        if (other.steps, other.columns, other.value_range, other.bins) != (self.steps, self.columns, self.value_range, self.bins):
+            raise ValueError("Cannot merge ensemble aggregates with different layouts.")
+        self.stats.merge(other.stats)
+        self.histogram += other.histogram
+        np.minimum(self.minimum, other.minimum, out=self.minimum)
+        np.maximum(self.maximum, other.maximum, out=self.maximum)
+
+    def mean(self):
+        """
+        Return the per-step mean of every column (NaN before any run is added).
+        """
+        if self.count == 0:
+            return pd.DataFrame(np.nan, index=range(self.steps), columns=self.columns)
+        return pd.DataFrame(self.stats.mean, columns=self.columns)
+
+    def variance(self):
+        """
+        Return the per-step sample variance of every column.
+        """
+        return pd.DataFrame(self.stats.variance(), columns=self.columns)
+
+    def std(self):
+        """
+        Return the per-step sample standard deviation of every column.
+        """
+        return np.sqrt(self.variance())
+
+    def quantile(self, q):
+        """
+        Return the approximate per-step q-quantile of every column.
+
+        Args:
+            q: Quantile between 0 and 1.
+        """
+        if self.count == 0:
+            return pd.DataFrame(np.nan, index=range(self.steps), columns=self.columns)
+        low, high = self.value_range
+        width = (high - low) / self.bins
+        cumulative = np.cumsum(self.histogram, axis=2)
+        target = q * self.count
+        # First bin whose cumulative count reaches the target, then interpolate inside it
+        index = np.minimum((cumulative < target).sum(axis=2), self.bins - 1)
+        in_bin = np.take_along_axis(self.histogram, index[..., None], axis=2)[..., 0]
+        before = np.take_along_axis(cumulative, index[..., None], axis=2)[..., 0] - in_bin
+        fraction = np.divide(target - before, in_bin, out=np.zeros(index.shape), where=in_bin > 0)
+        # Never report beyond the observed extremes, e.g. inside a bin of identical values
+        values = np.clip(low + (index + fraction) * width, self.minimum, self.maximum)
+        return pd.DataFrame(values, columns=self.columns)
+
+    def summary(self, quantiles=(0.05, 0.5, 0.95)):
+        """
+        Return mean, standard deviation and quantiles side by side.
+
+        Args:
+            quantiles: Quantiles to include (default: 5%, median and 95%).
+        """
+        frames = {"mean": self.mean(), "std": self.std()}
+        for q in quantiles:
+            frames[f"q{q:g}"] = self.quantile(q)
+        return pd.concat(frames, axis=1)
+
+def peak_infected(results):
+    """
+    Return the highest number of Infected agents during a run.
+    """
+    return results["Infected"].max()
+
+def final_dead(results):
+    """
+    Return the number of Dead agents at the end of a run.
+    """
+    return results["Dead"].iloc[-1]
+
+def time_to_peak(results):
+    """
+    Return the first step at which the number of Infected agents peaks.
+    """
+    return int(results["Infected"].to_numpy().argmax())
+
+OUTCOME_METRICS = {"peak_infected": peak_infected, "final_dead": final_dead, "time_to_peak": time_to_peak}
+
+class AdaptiveEnsemble:
+    def __init__(self, configurations, run, metrics=OUTCOME_METRICS, target_width=1.0, budget=1000, min_replicates=5, confidence=0.95):
+        """
+        Initialize an AdaptiveEnsemble.
+
+        Keeps adding replicates to whichever configuration has the widest
+        confidence intervals relative to their targets, until every outcome
+        metric is resolved or the global budget is spent.
+
+        Args:
+            configurations: Dictionary mapping a configuration name to the keyword arguments passed to run.
+            run: Function returning the results dataframe of one replicate for given keyword arguments.
+            metrics: Dictionary mapping a metric name to a function of the results dataframe (default: OUTCOME_METRICS).
+            target_width: Target full confidence interval width, either one number or a dictionary per metric (default: 1.0).
+                The metrics are in different units (agents, steps), so a dictionary is usually what you want.
+            budget: Maximum total number of replicates over all configurations (default: 1000).
+            min_replicates: Replicates run for every configuration before adapting (default: 5).
+            confidence: Confidence level of the Student-t interval (default: 0.95).
+        """
+        if min_replicates < 2:
+            raise ValueError("At least two replicates are needed to estimate a confidence interval.")
+        if budget < min_replicates * len(configurations):
+            raise ValueError(f"A budget of {budget} replicates cannot cover {min_replicates} replicates for each of the {len(configurations)} configurations.")
+        self.configurations = configurations
+        self.run = run
+        self.metrics = metrics
+        if isinstance(target_width, dict):
+            self.target_width = np.array([target_width[name] for name in metrics], dtype=float)
+        else:
+            self.target_width = np.full(len(metrics), float(target_width))
+        self.budget = budget
+        self.min_replicates = min_replicates
+        self.confidence = confidence
+        self.stats = {name: RunningStats(len(metrics)) for name in configurations}
+        self.replicates_run = 0
+
+    def add(self, name, aggregator=None):
+        """
+        Run one replicate of a configuration and fold in its outcome metrics.
+
+        Args:
+            name: Name of the configuration.
+            aggregator: Optional EnsembleAggregator that also receives the full run.
+        """
+        results = self.run(**self.configurations[name])
+        self.stats[name].add([metric(results) for metric in self.metrics.values()])
+        if aggregator is not None:
+            aggregator.add(results)
+        self.replicates_run += 1
+
+    def ci_width(self, name):
+        """
+        Return the current full confidence interval width of every metric for a configuration.
+
+        The width is NaN until the configuration has two replicates.
+        """
+        stats = self.stats[name]
+        if stats.count < 2:
+            return np.full(len(self.metrics), np.nan)
+        # Student-t rather than normal quantile, since replicate counts can be small
+        t = scipy_stats.t.ppf((1 + self.confidence) / 2, stats.count - 1)
+        return 2 * t * np.sqrt(stats.variance() / stats.count)
+
+    def resolved(self, name):
+        """
+        Check whether every metric of a configuration has reached its target width.
+        """
+        stats = self.stats[name]
+        return stats.count >= self.min_replicates and bool(np.all(self.ci_width(name) <= self.target_width))
+
+    def run_all(self, aggregators=None):
+        """
+        Run replicates until every configuration is resolved or the budget is spent.
+
+        Args:
+            aggregators: Optional dictionary mapping a configuration name to an EnsembleAggregator for the full runs.
+
+        Returns:
+            The summary dataframe.
+        """
+        aggregators = aggregators or {}
+        # Every configuration gets the minimum number of replicates first, round-robin
+        for _ in range(self.min_replicates):
+            for name in self.configurations:
+                if self.stats[name].count < self.min_replicates and self.replicates_run < self.budget:
+                    self.add(name, aggregators.get(name))
+
+        while self.replicates_run < self.budget:
+            unresolved = [name for name in self.configurations if not self.resolved(name)]
+            if not unresolved:
+                break
+            # Spend the next replicate where the intervals are furthest from their targets
+            name = max(unresolved, key=lambda n: np.max(self.ci_width(n) / self.target_width))
+            self.add(name, aggregators.get(name))
+        return self.summary()
+
+    def summary(self):
+        """
+        Return mean, confidence interval width and replicate count per configuration and metric.
+        """
+        rows = []
+        for name, stats in self.stats.items():
+            widths = self.ci_width(name)
+            for i, metric in enumerate(self.metrics):
+                rows.append({"configuration": name, "metric": metric, "mean": stats.mean[i] if stats.count else np.nan, "ci_width": widths[i],
+                             "replicates": stats.count, "resolved": self.resolved(name)})
+        return pd.DataFrame(rows)
@@ -13,9 +13,11 @@ from mesa.datacollection import DataCollector
 from Agent import SIERDAgent
 import numpy as np
 from AgentMayor import AgentMayor
+from Transmission import ContactMatrixEngine
+from Kernels import KernelEngine
 
 class SIERDModel(Model):
-    def __init__(self, width, height, density, transmission_rate, latency_period, infection_duration, recovery_rate, policy, num_districts, initial_infected,mask_policy=False, lockdown=False):
+    def __init__(self, width, height, density, transmission_rate, latency_period, infection_duration, recovery_rate, policy, num_districts, initial_infected,mask_policy=False, lockdown=False, engine="agent", population=None, tracer=None):
         """
         Initialize a SIERDModel.
 
@@ -32,8 +34,16 @@ class SIERDModel(Model):
             initial_infected: Number of initially infected agents.
             mask_policy: Initial mask policy status (default: False).
             lockdown: Initial lockdown status (default: False).
+            engine: Transmission engine, "agent" for per-agent cellmate checks, "sparse" for the synchronous contact-matrix model (different outcomes, see ContactMatrixEngine) or "kernel" for the compiled per-tick kernel (default: "agent").
+            population: Prebuilt Population to take the per-agent draws from (default: None, draw them here).
+            tracer: TransmissionTracer recording every exposure (default: None).
         """
+        if engine not in ("agent", "sparse", "kernel"):
+            raise ValueError(f"Unknown transmission engine: {engine}")
         self.num_agents = int(width * height * density)
+        if population is not None and len(population) != self.num_agents:
+            raise ValueError(f"Population has {len(population)} agents, the model needs {self.num_agents}.")
+        self.population = population
         self.grid = MultiGrid(width, height, True)
         self.schedule = RandomActivation(self)
         self.transmission_rate = transmission_rate
@@ -43,9 +53,13 @@ class SIERDModel(Model):
         self.policy = policy
         self.time_of_day = "morning"
         self.num_districts = num_districts
+        self.districts = self.create_districts(num_districts, width, height)
         self.mask_policy = mask_policy
         self.lockdown = lockdown
         self.mayor = None
+        self.contact_engine = None
+        self.kernel_engine = None
+        self.tracer = tracer
         
         # Initialize agents
         for i in range(self.num_agents):
@@ -72,6 +86,10 @@ class SIERDModel(Model):
             agent.state = "Infected"
             agent.infection_time = self.schedule.time
         
+        if engine == "sparse":
+            self.contact_engine = ContactMatrixEngine(self)
+        elif engine == "kernel":
+            self.kernel_engine = KernelEngine(self)
         
         self.datacollector = DataCollector(
             {"Susceptible": lambda m: self.count_state(m, "Susceptible"),
@@ -79,6 +97,7 @@ class SIERDModel(Model):
              "Infected": lambda m: self.count_state(m, "Infected"),
              "Recovered": lambda m: self.count_state(m, "Recovered"),
              "Dead": lambda m: self.count_state(m, "Dead")})
+        self.running = not self.is_steady_state()
 
     def count_state(self, model, state):
         """
@@ -88,8 +107,21 @@ class SIERDModel(Model):
             model: The model instance.
             state: The state to count.
         """
+        if model.kernel_engine:
+            return model.kernel_engine.count(state)
         return sum([1 for agent in model.schedule.agents if isinstance(agent, SIERDAgent) and agent.state == state])
 
+    def is_steady_state(self):
+        """
+        Check whether the epidemic has burned out.
+
+        With no Exposed or Infected agents and no active Mayor policy timers,
+        no agent can change state any more, so the compartment counts are frozen.
+        """
+        if self.mayor and (self.mayor.lockdown_policies or self.mayor.mask_policies):
+            return False
+        return not any(agent.state in ("Exposed", "Infected") for agent in self.schedule.agents if isinstance(agent, SIERDAgent))
+
     def create_districts(self, num_districts, width, height):
         districts = {}
         step = width // num_districts
@@ -114,7 +146,13 @@ class SIERDModel(Model):
     def step(self):
         #self.adjust_parameters()
         self.datacollector.collect(self)
-        self.schedule.step()
+        time = self.schedule.time
+        if self.kernel_engine:
+            self.kernel_engine.step(time)
+        else:
+            self.schedule.step()
+        if self.contact_engine:
+            self.contact_engine.step(time)
         
         # Update time of day
         if self.time_of_day == "morning":
@@ -128,6 +166,33 @@ class SIERDModel(Model):
         # If Mayor policy is active, execute Mayor's step
         if self.mayor:
             self.mayor.step()
+        self.running = not self.is_steady_state()
+
+    def run(self, steps, progress=None):
+        """
+        Run the model for a number of steps, stopping early once the epidemic has burned out.
+
+        Args:
+            steps: Number of steps to simulate.
+            progress: Function called with the number of completed steps after every step (default: None).
+
+        Returns:
+            The model-level results dataframe, padded to exactly steps rows.
+        """
+        for _ in range(steps):
+            if not self.running:
+                break
+            self.step()
+            if progress:
+                progress(self.schedule.steps)
+        if self.tracer is not None:
+            self.tracer.flush()
+        results = self.datacollector.get_model_vars_dataframe()
+        if len(results) < steps:
+            # In steady state every remaining row equals the current counts
+            self.datacollector.collect(self)
+            results = self.datacollector.get_model_vars_dataframe().reindex(range(steps), method="ffill")
+        return results
     
     def export_policy_records(self, filename):
         """
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+Array kernel that advances every agent of a SIERDModel in one call.
+"""
+
+import numpy as np
+from Agent import SIERDAgent
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        """
+        Stand-in for numba.njit that leaves the function as plain Python.
+        """
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda function: function
+
+STATES = ["Susceptible", "Exposed", "Infected", "Recovered", "Dead"]
+SUSCEPTIBLE, EXPOSED, INFECTED, RECOVERED, DEAD = range(5)
+PHASES = ["morning", "afternoon", "evening", "night"]
+
+# Moore neighbourhood offsets, in the order mesa's get_neighborhood lists them
+NEIGHBOURS = np.array([(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)], dtype=np.int64)
+
+@njit(cache=True)
+def seed_kernel(seed):
+    """
+    Seed the random number generator used inside the kernel.
+
+    Compiled, this is Numba's own generator; without Numba it would be
+    NumPy's global one, so KernelEngine only calls it when Numba is available.
+    """
+    np.random.seed(seed)
+
+@njit(cache=True)
+def decide_to_move(lockdown, health):
+    """
+    Logit move decision of SIERDAgent.decide_to_move: probability > 0.5 is logit > 0.
+    """
+    logit = 1.0 - 3.0 * lockdown - 1.0 * health + np.random.gumbel(0.0, 1.0)
+    return logit > 0
+
+@njit(cache=True)
+def move(agent, cell, cell_of, head, tail, next_agent, prev_agent):
+    """
+    Move an agent to the tail of another cell's linked list.
+    """
+    old = cell_of[agent]
+    if old == cell:
+        return
+    # Unlink from the old cell
+    if prev_agent[agent] >= 0:
+        next_agent[prev_agent[agent]] = next_agent[agent]
+    else:
+        head[old] = next_agent[agent]
+    if next_agent[agent] >= 0:
+        prev_agent[next_agent[agent]] = prev_agent[agent]
+    else:
+        tail[old] = prev_agent[agent]
+    # Append to the new cell, as MultiGrid does
+    prev_agent[agent] = tail[cell]
+    next_agent[agent] = -1
+    if tail[cell] >= 0:
+        next_agent[tail[cell]] = agent
+    else:
+        head[cell] = agent
+    tail[cell] = agent
+    cell_of[agent] = cell
+
+@njit(cache=True)
+def step_kernel(state, position, residence, workplace, wearing_mask, isolated, recovered, infection_time, recovered_now, events,
+                time, phase, lockdown, mask_policy, transmission_rate, latency_period, infection_duration, recovery_rate, width, height):
+    """
+    Apply one SIERDAgent.step to every agent, in random activation order.
+
+    Agents are handled one at a time exactly like the reference implementation,
+    so exposure stops at the first successful contact and infect_others changes
+    cellmates that are activated later in the same tick. Every exposure is
+    written to events as (infector, infectee, cell); the count is returned.
+    """
+    num_events = 0
+    num_agents = state.shape[0]
+    num_cells = width * height
+    head = np.full(num_cells, -1, dtype=np.int64)
+    tail = np.full(num_cells, -1, dtype=np.int64)
+    next_agent = np.full(num_agents, -1, dtype=np.int64)
+    prev_agent = np.full(num_agents, -1, dtype=np.int64)
+    cell_of = np.full(num_agents, -1, dtype=np.int64)
+    for agent in range(num_agents):
+        cell = position[agent, 0] * height + position[agent, 1]
+        prev_agent[agent] = tail[cell]
+        if tail[cell] >= 0:
+            next_agent[tail[cell]] = agent
+        else:
+            head[cell] = agent
+        tail[cell] = agent
+        cell_of[agent] = cell
+
+    for agent in np.random.permutation(num_agents):
+        # Movement, as in SIERDAgent.step and the move_* methods
+        health = 1 if state[agent] == EXPOSED or state[agent] == INFECTED else 0
+        x, y = residence[agent, 0], residence[agent, 1]
+        if phase == 0:
+            if decide_to_move(lockdown, health) and decide_to_move(lockdown, health):
+                x, y = workplace[agent, 0], workplace[agent, 1]
+        elif phase == 1 or phase == 2:
+            if decide_to_move(lockdown, health) and decide_to_move(lockdown, health):
+                offset = NEIGHBOURS[int(np.random.random() * 8)]
+                x = (position[agent, 0] + offset[0]) % width
+                y = (position[agent, 1] + offset[1]) % height
+        position[agent, 0] = x
+        position[agent, 1] = y
+        move(agent, x * height + y, cell_of, head, tail, next_agent, prev_agent)
+        cell = cell_of[agent]
+
+        if state[agent] == SUSCEPTIBLE or state[agent] == RECOVERED:
+            # check_exposure and check_reinfection
+            if not isolated[agent]:
+                rate = transmission_rate * (0.2 if wearing_mask[agent] else 1.0)
+                other = head[cell]
+                while other >= 0:
+                    if state[other] == INFECTED and np.random.random() < rate:
+                        state[agent] = EXPOSED
+                        infection_time[agent] = time
+                        events[num_events, 0] = other
+                        events[num_events, 1] = agent
+                        events[num_events, 2] = cell
+                        num_events += 1
+                        break
+                    other = next_agent[other]
+        elif state[agent] == EXPOSED:
+            if time - infection_time[agent] >= latency_period:
+                state[agent] = INFECTED
+        elif state[agent] == INFECTED:
+            if not isolated[agent]:
+                other = head[cell]
+                while other >= 0:
+                    if state[other] == SUSCEPTIBLE:
+                        rate = transmission_rate * (0.2 if wearing_mask[agent] else 1.0) * (0.5 if recovered[other] else 1.0)
+                        if np.random.random() < rate:
+                            state[other] = EXPOSED
+                            infection_time[other] = time
+                            events[num_events, 0] = agent
+                            events[num_events, 1] = other
+                            events[num_events, 2] = cell
+                            num_events += 1
+                    other = next_agent[other]
+            if time - infection_time[agent] >= infection_duration:
+                if np.random.random() < recovery_rate:
+                    state[agent] = RECOVERED
+                    recovered[agent] = True
+                    recovered_now[agent] = True
+                    # decide_to_wear_mask, with the agent now Recovered and its infection history non-empty
+                    sick = 0
+                    total = 0
+                    other = head[cell]
+                    while other >= 0:
+                        total += 1
+                        if state[other] == EXPOSED or state[other] == INFECTED:
+                            sick += 1
+                        other = next_agent[other]
+                    high = 1 if total > 0 and sick / total > 0.5 else 0
+                    logit = 1.0 + 1.5 * transmission_rate + 1.5 + 3.0 * mask_policy + 2.0 * high + np.random.gumbel(0.0, 1.0)
+                    wearing_mask[agent] = logit > 0
+                else:
+                    state[agent] = DEAD
+    return num_events
+
+class KernelEngine:
+    def __init__(self, model):
+        """
+        Initialize a KernelEngine.
+
+        Holds the agent state in arrays and advances it with step_kernel,
+        compiled with Numba when it is installed and plain Python otherwise.
+        While the engine is active the arrays are the source of truth; the
+        agent objects are synced after every tick for the data collector
+        and the Mayor.
+
+        Args:
+            model: The model instance.
+        """
+        self.model = model
+        self.agents = [agent for agent in model.schedule.agents if isinstance(agent, SIERDAgent)]
+        agents = self.agents
+        self.unique_ids = np.array([agent.unique_id for agent in agents], dtype=np.int64)
+        self.state = np.array([STATES.index(agent.state) for agent in agents], dtype=np.int8)
+        self.position = np.array([agent.pos for agent in agents], dtype=np.int64).reshape(-1, 2)
+        self.residence = np.array([agent.residence_area for agent in agents], dtype=np.int64).reshape(-1, 2)
+        self.workplace = np.array([agent.workplace for agent in agents], dtype=np.int64).reshape(-1, 2)
+        self.wearing_mask = np.array([agent.wearing_mask for agent in agents], dtype=np.bool_)
+        self.isolated = np.array([agent.isolated for agent in agents], dtype=np.bool_)
+        self.recovered = np.array([agent.recovered for agent in agents], dtype=np.bool_)
+        self.infection_time = np.array([agent.infection_time for agent in agents], dtype=np.int64)
+        if NUMBA_AVAILABLE:
+            seed_kernel(model.random.randrange(2 ** 32))
+
+    def count(self, state):
+        """
+        Count the number of agents in a given state.
+
+        Args:
+            state: The state to count.
+        """
+        return int(np.count_nonzero(self.state == STATES.index(state)))
+
+    def step(self, time):
+        """
+        Advance every agent by one tick and sync the agent objects.
+
+        Args:
+            time: The current time step.
+        """
+        model = self.model
+        previous_state = self.state.copy()
+        previous_position = self.position.copy()
+        previous_mask = self.wearing_mask.copy()
+        recovered_now = np.zeros(len(self.agents), dtype=np.bool_)
+        events = np.empty((len(self.agents), 3), dtype=np.int64)  # An agent is exposed at most once per tick
+        num_events = step_kernel(self.state, self.position, self.residence, self.workplace, self.wearing_mask, self.isolated, self.recovered,
+                                 self.infection_time, recovered_now, events, time, PHASES.index(model.time_of_day), bool(model.lockdown), bool(model.mask_policy),
+                                 float(model.transmission_rate), model.latency_period, model.infection_duration, float(model.recovery_rate),
+                                 model.grid.width, model.grid.height)
+        model.schedule.steps += 1
+        model.schedule.time += 1
+
+        if model.tracer is not None and num_events:
+            events = events[:num_events]
+            height = model.grid.height
+            model.tracer.record_many(model, time, self.unique_ids[events[:, 0]], self.unique_ids[events[:, 1]], events[:, 2] // height, events[:, 2] % height)
+
+        for index in np.flatnonzero((self.position != previous_position).any(axis=1)):
+            model.grid.move_agent(self.agents[index], tuple(self.position[index].tolist()))
+        for index in np.flatnonzero((self.state != previous_state) | (self.wearing_mask != previous_mask)):
+            agent = self.agents[index]
+            agent.state = STATES[self.state[index]]
+            agent.infection_time = int(self.infection_time[index])
+            agent.recovered = bool(self.recovered[index])
+            agent.wearing_mask = bool(self.wearing_mask[index])
+            if recovered_now[index]:
+                agent.infection_history.append(time)  # Add recovery time to infection history
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic populations shared between worker processes.
+"""
+
+import numpy as np
+from multiprocessing import shared_memory
+
+# Per-agent draws that stay fixed across replicates of the same synthetic city
+FIELDS = [("transmission_rate", "float64", ()),
+          ("latency_period", "int64", ()),
+          ("infection_duration", "int64", ()),
+          ("recovery_rate", "float64", ()),
+          ("residence_area", "int64", (2,)),
+          ("workplace", "int64", (2,))]
+
+class Population:
+    def __init__(self, arrays, shm=None):
+        """
+        Initialize a Population.
+
+        Args:
+            arrays: Dictionary mapping every field in FIELDS to an array with one row per agent.
+            shm: The shared memory block backing the arrays, if they were attached (default: None).
+        """
+        self.arrays = arrays
+        self.shm = shm
+
+    def __len__(self):
+        return len(self.arrays["transmission_rate"])
+
+    @classmethod
+    def build(cls, width, height, density, transmission_rate, latency_period, infection_duration, recovery_rate, seed=None):
+        """
+        Draw a synthetic population the same way SIERDAgent does, vectorized.
+
+        Args:
+            width: Width of the grid.
+            height: Height of the grid.
+            density: Density of the agents.
+            transmission_rate: Probability of transmission per contact.
+            latency_period: Number of steps an agent stays in the exposed state.
+            infection_duration: Number of steps an agent stays in the infected state.
+            recovery_rate: Probability of recovering from the infected state.
+            seed: Seed of the random number generator (default: None).
+        """
+        rng = np.random.default_rng(seed)
+        num_agents = int(width * height * density)
+        arrays = {
+            "transmission_rate": rng.lognormal(np.log(transmission_rate), 0.7, num_agents),
+            "latency_period": np.maximum(1, rng.lognormal(np.log(latency_period), 1.5, num_agents).astype(np.int64)),
+            "infection_duration": np.maximum(1, rng.lognormal(np.log(infection_duration), 1.5, num_agents).astype(np.int64)),
+            "recovery_rate": np.minimum(1, rng.lognormal(np.log(recovery_rate), 0.7, num_agents)),
+            "residence_area": np.column_stack([rng.integers(0, width, num_agents), rng.integers(0, height, num_agents)]),
+            "workplace": np.column_stack([rng.integers(0, width, num_agents), rng.integers(0, height, num_agents)]),
+        }
+        return cls(arrays)
+
+    def value(self, name, unique_id):
+        """
+        Return one agent's draw of a field, as a Python scalar or tuple.
+
+        Args:
+            name: The field, one of FIELDS.
+            unique_id: The unique ID of the agent.
+        """
+        value = self.arrays[name][unique_id]
+        return tuple(value.tolist()) if value.ndim else value.item()
+
+    def publish(self):
+        """
+        Copy the population into one shared memory block that worker processes can attach to.
+
+        Returns:
+            A SharedPopulation owning the block. Pass its handle to Population.attach in the workers.
+        """
+        num_agents = len(self)
+        layout = []
+        offset = 0
+        for name, dtype, shape in FIELDS:
+            nbytes = num_agents * int(np.prod(shape, dtype=np.int64)) * np.dtype(dtype).itemsize
+            layout.append((name, dtype, (num_agents,) + shape, offset))
+            offset += nbytes
+        shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for name, dtype, shape, start in layout:
+            view = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=start)
+            view[...] = self.arrays[name]
+            del view  # Views must be released before the block can be closed
+        return SharedPopulation(shm, {"name": shm.name, "layout": layout})
+
+    @classmethod
+    def attach(cls, handle):
+        """
+        Attach zero-copy, read-only views of a published population.
+
+        Args:
+            handle: The handle of a SharedPopulation.
+        """
+        shm = shared_memory.SharedMemory(name=handle["name"])
+        arrays = {}
+        for name, dtype, shape, offset in handle["layout"]:
+            array = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            array.flags.writeable = False
+            arrays[name] = array
+        return cls(arrays, shm)
+
+    def close(self):
+        """
+        Detach from the shared memory block, if any.
+        """
+        self.arrays = {}
+        if self.shm is not None:
+            self.shm.close()
+            self.shm = None
+
+class SharedPopulation:
+    def __init__(self, shm, handle):
+        """
+        Initialize a SharedPopulation.
+
+        Args:
+            shm: The shared memory block holding the population.
+            handle: Picklable description of the block, passed to the workers.
+        """
+        self.shm = shm
+        self.handle = handle
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.unlink()
+
+    def unlink(self):
+        """
+        Close and free the shared memory block once every worker is done.
+        """
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
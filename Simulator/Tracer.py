@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in recorder of who infected whom, where and when.
+"""
+
+import json
+import os
+import numpy as np
+import pandas as pd
+
+PHASES = {"morning": 0, "afternoon": 1, "evening": 2, "night": 3}
+
+# Columns of a transmission trace and the dtype each is stored with
+COLUMNS = [("infector", "int64"),
+           ("infectee", "int64"),
+           ("cell_x", "int32"),
+           ("cell_y", "int32"),
+           ("district", "int32"),  # -1 for cells outside every district
+           ("step", "int64"),
+           ("phase", "int8")]
+
+class TransmissionTracer:
+    def __init__(self, path=None, capacity=4096, chunk_size=65536):
+        """
+        Initialize a TransmissionTracer.
+
+        Records who infected whom, where and when into a preallocated
+        array that doubles when full. With a path, every chunk_size events
+        are appended to one raw binary file per column, so memory stays bounded.
+
+        Args:
+            path: Directory to write the trace to (default: None, keep it in memory).
+            capacity: Initial number of events the buffer holds (default: 4096).
+            chunk_size: Number of buffered events that triggers a flush to path (default: 65536).
+        """
+        self.path = path
+        self.chunk_size = chunk_size
+        self.buffer = np.empty((min(capacity, chunk_size) if path else capacity, len(COLUMNS)), dtype=np.int64)
+        self.size = 0
+        self.flushed = 0
+        self.district_grid = None
+        if path:
+            os.makedirs(path, exist_ok=True)
+            with open(os.path.join(path, "schema.json"), "w") as f:
+                json.dump(COLUMNS, f)
+            for name, _ in COLUMNS:
+                open(os.path.join(path, f"{name}.bin"), "wb").close()
+
+    def __len__(self):
+        return self.flushed + self.size
+
+    def _reserve(self, count):
+        if self.path and self.size + count > self.chunk_size:
+            self.flush()
+        if self.size + count > len(self.buffer):
+            grown = np.empty((max(2 * len(self.buffer), self.size + count), len(COLUMNS)), dtype=np.int64)
+            grown[:self.size] = self.buffer[:self.size]
+            self.buffer = grown
+
+    def record(self, infector, infectee):
+        """
+        Record that infector exposed infectee in the infectee's current cell.
+
+        Args:
+            infector: The infected agent.
+            infectee: The newly exposed agent.
+        """
+        if self.size == len(self.buffer) or (self.path and self.size == self.chunk_size):
+            self._reserve(1)
+        model = infectee.model
+        x, y = infectee.pos
+        self.buffer[self.size] = (infector.unique_id, infectee.unique_id, x, y, model.districts.get((x, y), -1),
+                                  model.schedule.time, PHASES[model.time_of_day])
+        self.size += 1
+
+    def record_many(self, model, step, infector, infectee, cell_x, cell_y):
+        """
+        Record a batch of exposures from one tick.
+
+        Args:
+            model: The model instance.
+            step: The time step of the exposures.
+            infector: Array of infector IDs.
+            infectee: Array of infectee IDs.
+            cell_x: Array of the x coordinates of the cells.
+            cell_y: Array of the y coordinates of the cells.
+        """
+        count = len(infectee)
+        if count == 0:
+            return
+        if self.district_grid is None:
+            self.district_grid = np.full((model.grid.width, model.grid.height), -1, dtype=np.int64)
+            for (x, y), district_id in model.districts.items():
+                if x < model.grid.width and y < model.grid.height:
+                    self.district_grid[x, y] = district_id
+        self._reserve(count)
+        rows = self.buffer[self.size:self.size + count]
+        rows[:, 0] = infector
+        rows[:, 1] = infectee
+        rows[:, 2] = cell_x
+        rows[:, 3] = cell_y
+        rows[:, 4] = self.district_grid[cell_x, cell_y]
+        rows[:, 5] = step
+        rows[:, 6] = PHASES[model.time_of_day]
+        self.size += count
+
+    def flush(self):
+        """
+        Append the buffered events to the column files, if the tracer has a path.
+        """
+        if not self.path or self.size == 0:
+            return
+        for i, (name, dtype) in enumerate(COLUMNS):
+            with open(os.path.join(self.path, f"{name}.bin"), "ab") as f:
+                self.buffer[:self.size, i].astype(dtype).tofile(f)
+        self.flushed += self.size
+        self.size = 0
+
+    def to_dataframe(self):
+        """
+        Return every recorded event, from the files and the buffer, as a dataframe.
+        """
+        self.flush()
+        if self.path:
+            return load_trace(self.path)
+        return pd.DataFrame({name: self.buffer[:self.size, i].astype(dtype) for i, (name, dtype) in enumerate(COLUMNS)})
+
+def load_trace(path):
+    """
+    Load a transmission trace written by a TransmissionTracer.
+
+    Args:
+        path: Directory of the trace.
+    """
+    with open(os.path.join(path, "schema.json")) as f:
+        columns = json.load(f)
+    return pd.DataFrame({name: np.fromfile(os.path.join(path, f"{name}.bin"), dtype=dtype) for name, dtype in columns})
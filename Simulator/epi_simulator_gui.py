@@ -35,9 +35,7 @@ def run_simulation(width, height, density, transmission_rate, latency_period, in
     """
     
     model = SIERDModel(width, height, density, transmission_rate, latency_period, infection_duration, recovery_rate, policy, num_districts, initial_infected)
-    for _ in range(steps):
-        model.step()
-    results_cumulative = model.datacollector.get_model_vars_dataframe()
+    results_cumulative = model.run(steps)
     return results_cumulative
 
 def save_results(results, filename):
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+Local simulation job service.
+
+Clients connect over TCP on localhost and send one JSON request per line:
+
+    {"id": 1, "type": "simulation", "params": {"width": 10, ..., "steps": 500}}
+    {"id": 2, "type": "sweep", "params": {...}, "sweep": {"transmission_rate": [0.2, 0.4, 0.6]}}
+
+params are the keyword arguments of SIERDModel plus steps. The service
+answers with one JSON event per line, tagged with the request id:
+"queued", "progress" (after every step), "result" or "error" per job,
+and a final "done" once every job of the request has finished.
+Identical jobs that are already queued or running are shared instead of
+being run twice.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import socket
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from Environment import SIERDModel
+
+def _seed_worker():
+    """
+    Worker initializer: reseed the random number generators.
+    """
+    # Forked workers inherit the parent's random state, so jobs would repeat
+    random.seed()
+    np.random.seed()
+
+def _run_job(job_id, params, progress_queue):
+    """
+    Worker job: run one simulation and report progress after every step.
+    """
+    params = dict(params)
+    steps = params.pop("steps")
+    model = SIERDModel(**params)
+    results = model.run(steps, progress=lambda step: progress_queue.put((job_id, step, steps)))
+    return results.to_dict(orient="list")
+
+def job_key(params):
+    """
+    Return the deduplication key of a job: a hash of its canonical parameters.
+    """
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+def expand_request(request):
+    """
+    Expand a simulation or sweep request into the parameters of its jobs.
+
+    Args:
+        request: The decoded request.
+    """
+    if not isinstance(request, dict):
+        raise ValueError("A request must be a JSON object.")
+    params = request.get("params", {})
+    if not isinstance(params, dict):
+        raise ValueError("params must be a JSON object.")
+    if "steps" not in params:
+        raise ValueError("params must include steps.")
+    if request.get("type", "simulation") == "simulation":
+        return [params]
+    if request["type"] == "sweep":
+        sweep = request.get("sweep", {})
+        if not isinstance(sweep, dict) or not all(isinstance(values, list) for values in sweep.values()):
+            raise ValueError("sweep must map parameter names to lists of values.")
+        names = list(sweep)
+        values = [sweep[name] for name in names]
+        return [{**params, **dict(zip(names, point))} for point in itertools.product(*values)]
+    raise ValueError(f"Unknown request type: {request['type']}")
+
+class JobService:
+    def __init__(self, workers=None):
+        """
+        Initialize a JobService.
+
+        Args:
+            workers: Number of worker processes, and so of jobs running at once (default: number of CPUs).
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.jobs = {}  # Subscriber queues of the queued and running jobs, by job key
+        self.queue = asyncio.Queue()
+        self.manager = multiprocessing.Manager()
+        self.progress_queue = self.manager.Queue()
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_seed_worker)
+        self.tasks = []
+
+    def start(self):
+        """
+        Start the dispatchers and the progress relay on the running event loop.
+        """
+        self.tasks = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+        self.tasks.append(asyncio.create_task(self._relay_progress()))
+
+    async def close(self):
+        """
+        Stop dispatching and shut the worker processes down.
+        """
+        for task in self.tasks:
+            task.cancel()
+        self.progress_queue.put(None)  # Wakes the relay thread up
+        self.executor.shutdown(cancel_futures=True)
+        self.manager.shutdown()
+
+    def submit(self, params, subscriber):
+        """
+        Queue a job, or join the identical job already in flight.
+
+        Args:
+            params: The job parameters.
+            subscriber: asyncio.Queue that receives the job's events.
+
+        Returns:
+            The job key.
+        """
+        key = job_key(params)
+        if key in self.jobs:
+            self.jobs[key].append(subscriber)
+        else:
+            self.jobs[key] = [subscriber]
+            self.queue.put_nowait((key, params))
+        return key
+
+    def publish(self, key, event):
+        for subscriber in self.jobs.get(key, []):
+            subscriber.put_nowait(event)
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            key, params = await self.queue.get()
+            try:
+                results = await loop.run_in_executor(self.executor, _run_job, key, params, self.progress_queue)
+                self.publish(key, {"event": "result", "job": key, "results": results})
+            except Exception as e:
+                self.publish(key, {"event": "error", "job": key, "message": str(e)})
+            finally:
+                del self.jobs[key]
+
+    async def _relay_progress(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # The manager queue blocks, so it is read from a thread
+            item = await loop.run_in_executor(None, self.progress_queue.get)
+            if item is None:
+                return
+            key, step, steps = item
+            self.publish(key, {"event": "progress", "job": key, "step": step, "steps": steps})
+
+    async def handle_client(self, reader, writer):
+        """
+        Serve the requests of one client connection.
+        """
+        lock = asyncio.Lock()
+
+        async def send(event):
+            async with lock:
+                writer.write((json.dumps(event) + "\n").encode("utf-8"))
+                await writer.drain()
+
+        tasks = []
+        try:
+            while line := await reader.readline():
+                if line.strip():
+                    tasks.append(asyncio.create_task(self._serve_request(line, send)))
+            await asyncio.gather(*tasks)
+        except ConnectionError:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def _serve_request(self, line, send):
+        request_id = None
+        try:
+            request = json.loads(line)
+            if isinstance(request, dict):
+                request_id = request.get("id")
+            jobs = expand_request(request)
+        except (ValueError, TypeError) as e:
+            await send({"event": "error", "request": request_id, "message": str(e)})
+            return
+        events = asyncio.Queue()
+        for params in jobs:
+            key = self.submit(params, events)
+            await send({"event": "queued", "request": request_id, "job": key, "params": params})
+        pending = len(jobs)
+        while pending:
+            event = await events.get()
+            await send({**event, "request": request_id})
+            if event["event"] in ("result", "error"):
+                pending -= 1
+        await send({"event": "done", "request": request_id})
+
+async def serve(host, port, workers):
+    """
+    Run the job service until it is interrupted.
+
+    Args:
+        host: Address to listen on.
+        port: Port to listen on.
+        workers: Number of worker processes.
+    """
+    service = JobService(workers)
+    service.start()
+    server = await asyncio.start_server(service.handle_client, host, port, limit=2 ** 24)
+    print(f"Job service listening on {host}:{port} with {service.workers} workers")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+def submit(request, host="127.0.0.1", port=8765):
+    """
+    Send one request to a running job service and yield its events until it is done.
+
+    Args:
+        request: The request, e.g. {"type": "simulation", "params": {...}}.
+        host: Address of the service (default: 127.0.0.1).
+        port: Port of the service (default: 8765).
+    """
+    with socket.create_connection((host, port)) as connection:
+        connection.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        with connection.makefile("r", encoding="utf-8") as stream:
+            for line in stream:
+                event = json.loads(line)
+                yield event
+                if event["event"] == "done" or (event["event"] == "error" and "job" not in event):
+                    return
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: number of CPUs)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers))
+    except KeyboardInterrupt:
+        pass
@@ -8,10 +8,18 @@ Created on Sun Jun 16 17:34:28 2024
 import argparse
 import pandas as pd
 import os
+import random
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 import matplotlib.pyplot as plt
 from Environment import SIERDModel
+from Ensemble import EnsembleAggregator, AdaptiveEnsemble, OUTCOME_METRICS
+from Population import Population
+from Tracer import TransmissionTracer
 
-def run_simulation(width, height, density, transmission_rate, latency_period, infection_duration, recovery_rate, policy, num_districts, initial_infected, steps):
+_population = None  # Population attached by each worker process
+
+def run_simulation(width, height, density, transmission_rate, latency_period, infection_duration, recovery_rate, policy, num_districts, initial_infected, steps, engine="agent", population=None, tracer=None):
     """
     Run the SIERD simulation.
 
@@ -27,12 +35,13 @@ def run_simulation(width, height, density, transmission_rate, latency_period, in
         num_districts: Number of districts in the environment.
         initial_infected: Number of initially infected agents.
         steps: Number of steps to simulate.
+        engine: Simulation engine, "agent", "sparse" or "kernel" (default: "agent").
+        population: Prebuilt Population to reuse (default: None, draw a new one).
+        tracer: TransmissionTracer recording every exposure (default: None).
     """
     
-    model = SIERDModel(width, height, density, transmission_rate, latency_period, infection_duration, recovery_rate, policy, num_districts, initial_infected)
-    for _ in range(steps):
-        model.step()
-    results = model.datacollector.get_model_vars_dataframe()
+    model = SIERDModel(width, height, density, transmission_rate, latency_period, infection_duration, recovery_rate, policy, num_districts, initial_infected, engine=engine, population=population, tracer=tracer)
+    results = model.run(steps)
     return results
 
     if policy == "Mayor":
@@ -40,6 +49,95 @@ def run_simulation(width, height, density, transmission_rate, latency_period, in
         model.export_policy_records(policy_filename)
     return results
 
+def run_ensemble(width, height, density, transmission_rate, latency_period, infection_duration, recovery_rate, policy, num_districts, initial_infected, steps, replicates, engine="agent", aggregator=None, population=None):
+    """
+    Run replicates of the SIERD simulation and fold them into streaming statistics.
+
+    Args:
+        width: Width of the grid.
+        height: Height of the grid.
+        density: Density of the agents.
+        transmission_rate: Probability of transmission per contact.
+        latency_period: Number of steps an agent stays in the exposed state.
+        infection_duration: Number of steps an agent stays in the infected state.
+        recovery_rate: Probability of recovering from the infected state.
+        policy: Policy applied to agents (e.g., Mask Policy Only, Lockdown Only)
+        num_districts: Number of districts in the environment.
+        initial_infected: Number of initially infected agents.
+        steps: Number of steps to simulate.
+        replicates: Number of replicates to run.
+        engine: Simulation engine, "agent", "sparse" or "kernel" (default: "agent").
+        aggregator: EnsembleAggregator to fold the runs into (default: a new one).
+        population: Prebuilt Population shared by every replicate (default: None, draw a new one per replicate).
+    """
+    if aggregator is None:
+        aggregator = EnsembleAggregator(steps, value_range=(0, int(width * height * density)))
+    for _ in range(replicates):
+        results = run_simulation(width, height, density, transmission_rate, latency_period, infection_duration, recovery_rate, policy, num_districts, initial_infected, steps, engine, population)
+        aggregator.add(results)
+    return aggregator
+
+def _attach_population(handle):
+    """
+    Worker initializer: attach the shared population, if any, and reseed the random number generators.
+    """
+    global _population
+    if handle is not None:
+        _population = Population.attach(handle)
+    # Forked workers inherit the parent's random state, so replicates would repeat
+    random.seed()
+    np.random.seed()
+
+def _run_replicates(params, replicates, aggregator):
+    """
+    Worker job: run replicates, on the shared population if any, and return their partial aggregate.
+    """
+    for _ in range(replicates):
+        aggregator.add(run_simulation(**params, population=_population))
+    return aggregator
+
+def run_parallel_ensemble(width, height, density, transmission_rate, latency_period, infection_duration, recovery_rate, policy, num_districts, initial_infected, steps, replicates, engine="agent", workers=None, population=None):
+    """
+    Run replicates in parallel worker processes.
+
+    When a population is given it is published once in shared memory, and
+    every worker attaches to it read-only instead of drawing its own.
+    Otherwise every replicate draws a new population, as in run_ensemble.
+
+    Args:
+        width: Width of the grid.
+        height: Height of the grid.
+        density: Density of the agents.
+        transmission_rate: Probability of transmission per contact.
+        latency_period: Number of steps an agent stays in the exposed state.
+        infection_duration: Number of steps an agent stays in the infected state.
+        recovery_rate: Probability of recovering from the infected state.
+        policy: Policy applied to agents (e.g., Mask Policy Only, Lockdown Only)
+        num_districts: Number of districts in the environment.
+        initial_infected: Number of initially infected agents.
+        steps: Number of steps to simulate.
+        replicates: Number of replicates to run.
+        engine: Simulation engine, "agent", "sparse" or "kernel" (default: "agent").
+        workers: Number of worker processes (default: number of CPUs).
+        population: Prebuilt Population shared by every replicate (default: None, draw a new one per replicate).
+    """
+    workers = workers or os.cpu_count() or 1
+    params = dict(width=width, height=height, density=density, transmission_rate=transmission_rate, latency_period=latency_period, infection_duration=infection_duration, recovery_rate=recovery_rate, policy=policy, num_districts=num_districts, initial_infected=initial_infected, steps=steps, engine=engine)
+    aggregator = EnsembleAggregator(steps, value_range=(0, int(width * height * density)))
+    shared = population.publish() if population is not None else None
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach_population, initargs=(shared.handle if shared else None,)) as executor:
+            # One job per worker; each folds its replicates locally and the partial aggregates are merged
+            chunks = [replicates // workers + (1 if i < replicates % workers else 0) for i in range(workers)]
+            empty = EnsembleAggregator(steps, value_range=aggregator.value_range)
+            jobs = [executor.submit(_run_replicates, params, chunk, empty) for chunk in chunks if chunk > 0]
+            for job in jobs:
+                aggregator.merge(job.result())
+    finally:
+        if shared is not None:
+            shared.unlink()
+    return aggregator
+
 def save_results(results, filename):
     """
     Save the simulation results to a CSV file.
@@ -62,9 +160,32 @@ if __name__ == "__main__":
     parser.add_argument("--num_districts", type=int, default=5, help="Number of districts in the environment")
     parser.add_argument("--initial_infected", type=int, default=50, help="Number of initially infected agents")
     parser.add_argument("--steps", type=int, default=500, help="Number of steps to simulate")
+    parser.add_argument("--engine", type=str, default="agent", choices=["agent", "sparse", "kernel"], help="Simulation engine; \"kernel\" reproduces \"agent\", \"sparse\" is a different synchronous-update model with smaller epidemics")
+    parser.add_argument("--replicates", type=int, default=1, help="Number of replicates per policy")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes for replicates")
+    parser.add_argument("--fixed_city", action="store_true", help="Draw one synthetic population and reuse it for every policy and replicate")
+    parser.add_argument("--city_seed", type=int, default=None, help="Seed of the fixed synthetic population")
+    parser.add_argument("--ci_width", type=str, default=None, help="Target 95%% confidence interval width per outcome metric, e.g. peak_infected=20,final_dead=20,time_to_peak=40; enables adaptive replicates")
+    parser.add_argument("--budget", type=int, default=200, help="Maximum total number of replicates in adaptive mode")
+    parser.add_argument("--trace_dir", type=str, default=None, help="Directory to write the transmission trace of each policy to; single runs only")
     parser.add_argument("--output_dir", type=str, default="results", help="Output directory to save the results")
     args = parser.parse_args()
 
+    # Parse the per-metric targets of adaptive mode; only the metrics given drive the allocation
+    ci_targets = None
+    if args.ci_width is not None:
+        try:
+            ci_targets = {name.strip(): float(width) for name, width in (item.split("=") for item in args.ci_width.split(","))}
+        except ValueError:
+            parser.error("--ci_width must look like peak_infected=20,final_dead=20,time_to_peak=40")
+        unknown = set(ci_targets) - set(OUTCOME_METRICS)
+        if unknown:
+            parser.error(f"Unknown outcome metrics in --ci_width: {', '.join(sorted(unknown))}. Choose from {', '.join(OUTCOME_METRICS)}")
+
+    # A trace follows one run; ensembles would interleave or overwrite the traces of their replicates
+    if args.trace_dir is not None and (args.replicates > 1 or ci_targets is not None):
+        parser.error("--trace_dir records a single run per policy and cannot be combined with --replicates > 1 or --ci_width")
+
     # Define policies
     policies = ["No Interventions", "Lockdown Only", "Mask Policy Only", "Combination of Lockdown and Mask Policy", "Mayor"]
 
@@ -72,10 +193,49 @@ if __name__ == "__main__":
     if not os.path.exists(args.output_dir):
         os.makedirs(args.output_dir)
 
+    # A fixed city is drawn once, so policies and replicates differ only in their dynamics
+    population = None
+    if args.fixed_city:
+        population = Population.build(args.width, args.height, args.density, args.transmission_rate, args.latency_period, args.infection_duration, args.recovery_rate, args.city_seed)
+    elif args.city_seed is not None:
+        parser.error("--city_seed requires --fixed_city")
+
+    # Adaptive mode: spend replicates on the policies whose outcomes are still uncertain
+    aggregators = None
+    if ci_targets is not None:
+        configurations = {policy: dict(width=args.width, height=args.height, density=args.density, transmission_rate=args.transmission_rate, latency_period=args.latency_period, infection_duration=args.infection_duration, recovery_rate=args.recovery_rate, policy=policy, num_districts=args.num_districts, initial_infected=args.initial_infected, steps=args.steps, engine=args.engine, population=population) for policy in policies}
+        aggregators = {policy: EnsembleAggregator(args.steps, value_range=(0, int(args.width * args.height * args.density))) for policy in policies}
+        metrics = {name: OUTCOME_METRICS[name] for name in ci_targets}
+        try:
+            adaptive = AdaptiveEnsemble(configurations, run_simulation, metrics=metrics, target_width=ci_targets, budget=args.budget)
+        except ValueError as e:
+            parser.error(str(e))
+        summary = adaptive.run_all(aggregators)
+        summary_filename = f"{args.output_dir}/adaptive_summary.csv"
+        save_results(summary, summary_filename)
+        print(summary)
+        print(f"Adaptive ensemble summary saved to {summary_filename}")
+
     # Run model for each policy
     for policy in policies:
         print(f"Running model with policy: {policy}")
-        results = run_simulation(args.width, args.height, args.density, args.transmission_rate, args.latency_period, args.infection_duration, args.recovery_rate, policy, args.num_districts, args.initial_infected, args.steps)
+        if aggregators is not None:
+            results = aggregators[policy].mean()
+        elif args.replicates > 1 and args.workers > 1:
+            aggregator = run_parallel_ensemble(args.width, args.height, args.density, args.transmission_rate, args.latency_period, args.infection_duration, args.recovery_rate, policy, args.num_districts, args.initial_infected, args.steps, args.replicates, args.engine, args.workers, population)
+            results = aggregator.mean()
+            summary_filename = f"{args.output_dir}/summary_{policy.replace(' ', '_').lower()}.csv"
+            save_results(aggregator.summary(), summary_filename)
+            print(f"Ensemble summary saved to {summary_filename}")
+        elif args.replicates > 1:
+            aggregator = run_ensemble(args.width, args.height, args.density, args.transmission_rate, args.latency_period, args.infection_duration, args.recovery_rate, policy, args.num_districts, args.initial_infected, args.steps, args.replicates, args.engine, population=population)
+            results = aggregator.mean()
+            summary_filename = f"{args.output_dir}/summary_{policy.replace(' ', '_').lower()}.csv"
+            save_results(aggregator.summary(), summary_filename)
+            print(f"Ensemble summary saved to {summary_filename}")
+        else:
+            tracer = TransmissionTracer(f"{args.trace_dir}/{policy.replace(' ', '_').lower()}") if args.trace_dir else None
+            results = run_simulation(args.width, args.height, args.density, args.transmission_rate, args.latency_period, args.infection_duration, args.recovery_rate, policy, args.num_districts, args.initial_infected, args.steps, args.engine, population, tracer)
         
         # Save results to CSV
         csv_filename = f"{args.output_dir}/results_{policy.replace(' ', '_').lower()}.csv"
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Statistical equivalence of the kernel engine and the reference agent engine.
+"""
+
+import importlib.util
+import os
+import random
+import sys
+import numpy as np
+import pytest
+import Environment
+from Environment import SIERDModel
+
+REPLICATES = 30
+STEPS = 50
+TIME_POINTS = [10, 25, 49]
+
+def run_replicates(engine):
+    """
+    Run seeded replicates of a small model and collect their outcomes.
+    """
+    outcomes = []
+    for seed in range(REPLICATES):
+        random.seed(seed)
+        np.random.seed(seed)
+        model = SIERDModel(10, 10, 4, 0.4, 5, 10, 0.3, "No Interventions", 5, 10, engine=engine)
+        results = model.run(STEPS)
+        infected = results["Infected"].to_numpy()
+        outcomes.append([infected.max(), results["Dead"].iloc[-1]] + [infected[t] for t in TIME_POINTS])
+    return np.array(outcomes, dtype=float)
+
+def assert_same_means(reference, candidate):
+    """
+    Check that every outcome mean agrees within four combined standard errors.
+    """
+    names = ["peak Infected", "final Dead"] + [f"Infected at step {t}" for t in TIME_POINTS]
+    standard_error = np.sqrt(reference.var(axis=0, ddof=1) / len(reference) + candidate.var(axis=0, ddof=1) / len(candidate))
+    difference = np.abs(reference.mean(axis=0) - candidate.mean(axis=0))
+    for name, diff, se in zip(names, difference, standard_error):
+        assert diff <= 4 * se + 1, f"{name}: means differ by {diff:.1f} (standard error {se:.1f})"
+
+@pytest.fixture(scope="module")
+def agent_outcomes():
+    return run_replicates("agent")
+
+@pytest.fixture
+def fallback_kernels(monkeypatch):
+    """
+    A copy of the Kernels module imported as if Numba were not installed.
+    """
+    monkeypatch.setitem(sys.modules, "numba", None)
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Kernels.py")
+    spec = importlib.util.spec_from_file_location("Kernels_fallback", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    monkeypatch.setattr(Environment, "KernelEngine", module.KernelEngine)
+    return module
+
+def test_kernel_matches_agent_engine(agent_outcomes):
+    assert_same_means(agent_outcomes, run_replicates("kernel"))
+
+def test_fallback_matches_agent_engine(agent_outcomes, fallback_kernels):
+    assert not fallback_kernels.NUMBA_AVAILABLE
+    assert_same_means(agent_outcomes, run_replicates("kernel"))
+
+def test_fallback_leaves_global_random_state(fallback_kernels):
+    model = SIERDModel(10, 10, 4, 0.4, 5, 10, 0.3, "No Interventions", 5, 10)
+    np.random.seed(7)
+    expected = np.random.random()
+    np.random.seed(7)
+    fallback_kernels.KernelEngine(model)
+    assert np.random.random() == expected
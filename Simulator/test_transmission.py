@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+Documented gap between the synchronous sparse engine and the reference agent engine.
+"""
+
+import random
+import numpy as np
+from Environment import SIERDModel
+
+REPLICATES = 20
+STEPS = 60
+
+def final_dead(engine, policy):
+    """
+    Run seeded replicates of a small model and collect their final number of dead agents.
+    """
+    outcomes = []
+    for seed in range(REPLICATES):
+        random.seed(seed)
+        np.random.seed(seed)
+        model = SIERDModel(10, 10, 4, 0.4, 5, 10, 0.3, policy, 5, 10, engine=engine)
+        outcomes.append(model.run(STEPS)["Dead"].iloc[-1])
+    return np.array(outcomes, dtype=float)
+
+def test_sparse_engine_has_smaller_lockdown_epidemics():
+    # Contacts at old positions are lost when exposure is checked after everyone has moved
+    reference = final_dead("agent", "Lockdown Only")
+    sparse = final_dead("sparse", "Lockdown Only")
+    standard_error = np.sqrt(reference.var(ddof=1) / REPLICATES + sparse.var(ddof=1) / REPLICATES)
+    assert reference.mean() - sparse.mean() > 4 * standard_error
+    assert sparse.mean() < 0.75 * reference.mean()